@@ -5,19 +5,33 @@ Lucide C++ Icon Library Build Script
 This script:
 1. Scans the lucide/icons directory for SVG files
 2. Extracts path data from each SVG
-3. Generates C++ code for icon registration
+3. Generates C++ code for icon registration and icon functions as a single
+   translation unit, so the library header is only parsed once
 4. Creates optimized binary data for icons
+
+It only uses the standard library and runs on both CPython and PyPy; CMake
+prefers pypy3 when it is installed. To run it by hand:
+
+    pypy3 script/buildbinary.py --output-dir build/generated
 """
 
+import io
 import os
-import re
 import json
+import mmap
+from hashlib import blake2b
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # C++ keywords and reserved words that cannot be used as function names
-CPP_KEYWORDS = {
+CPP_KEYWORDS = frozenset({
     'alignas', 'alignof', 'and', 'and_eq', 'asm', 'atomic_cancel', 'atomic_commit',
     'atomic_noexcept', 'auto', 'bitand', 'bitor', 'bool', 'break', 'case', 'catch',
     'char', 'char8_t', 'char16_t', 'char32_t', 'class', 'compl', 'concept', 'const',
@@ -32,96 +46,238 @@ CPP_KEYWORDS = {
     'template', 'this', 'thread_local', 'throw', 'true', 'try', 'typedef',
     'typeid', 'typename', 'union', 'unsigned', 'using', 'virtual', 'void',
     'volatile', 'wchar_t', 'while', 'xor', 'xor_eq'
-}
+})
 
-def extract_svg_content(svg_file: Path) -> str:
-    """Extract the inner content of an SVG file."""
-    try:
-        with open(svg_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Extract everything between <svg> tags, excluding the svg tag itself
-        pattern = r'<svg[^>]*>([\s\S]*?)</svg>'
-        match = re.search(pattern, content)
-        
-        if match:
-            return match.group(1).strip()
+# Translation table converting kebab-case to snake_case in a single pass
+_HYPHEN_TRANS = str.maketrans('-', '_')
+
+# Files emitted into the output directory
+OUTPUT_FILES = (
+    "icons_all.cpp",
+    "icon_declarations.hpp",
+    "icon_list.json",
+)
+
+# Fixed fragments around the per-icon substitutions in the generated code
+_REGISTRY_HEAD = '            registry.registerIcon("'
+_REGISTRY_MID = '", R"svg('
+_REGISTRY_TAIL = ')svg");\n'
+_FUNC_HEAD = "        std::string "
+_FUNC_MID = "(const IconConfig& config) {\n            return IconRegistry::getInstance().generateSVG(\""
+_FUNC_TAIL = "\", config);\n        }\n\n"
+_DECL_HEAD = "        std::string "
+_DECL_TAIL = "(const IconConfig& config = IconConfig{});\n"
+
+# Files smaller than this are read in one call instead of being mapped
+_MMAP_THRESHOLD = mmap.PAGESIZE
+
+# Number of icons whose fragments are joined before each buffer write
+_BATCH_SIZE = 256
+
+# Incremental build state kept next to the generated files
+MANIFEST_FILE = ".icon_manifest.json"
+CACHE_FILE = ".icon_cache.json"
+
+def _slice_svg_body(content) -> str:
+    """Return the decoded markup between the <svg ...> and </svg> tags of a bytes-like buffer."""
+    # Slice out everything between the opening <svg ...> tag and the
+    # closing </svg>, decoding only the extracted bytes
+    start = content.find(b'<svg')
+    if start < 0:
         return ""
+    begin = content.find(b'>', start) + 1
+    end = content.rfind(b'</svg>')
+    
+    if begin > 0 and end > begin:
+        return content[begin:end].strip().decode('utf-8')
+    return ""
+
+def _hash_and_slice(content, known_hash: Optional[str]) -> Tuple[str, Optional[str]]:
+    """Hash a bytes-like buffer and extract its SVG body unless the hash is already known."""
+    digest = blake2b(content, digest_size=8).hexdigest()
+    if known_hash and digest == known_hash:
+        return digest, None
+    return digest, _slice_svg_body(content)
+
+def hash_and_extract(svg_file: Union[str, Path], known_hash: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """Return the content hash of an SVG file and its inner content.
+    
+    The content is None when the hash matches known_hash, so the caller can
+    reuse the copy cached by a previous run.
+    """
+    try:
+        # Unbuffered raw file: a single read needs no BufferedReader on top
+        with open(svg_file, 'rb', buffering=0) as f:
+            # Most icons fit in one page, where one read() beats setting up a
+            # mapping; empty files cannot be mapped at all
+            if os.fstat(f.fileno()).st_size < _MMAP_THRESHOLD:
+                return _hash_and_slice(f.read(), known_hash)
+            
+            # Search the page cache directly; only the extracted slice is copied
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return _hash_and_slice(mm, known_hash)
     except Exception as e:
         print(f"Error reading {svg_file}: {e}")
-        return ""
+        return "", ""
+
+def extract_svg_content(svg_file: Union[str, Path]) -> str:
+    """Extract the inner content of an SVG file."""
+    return hash_and_extract(svg_file)[1]
+
+def _process_one(icon_name: str, svg_path: str, known_hash: Optional[str]) -> Tuple[str, str, Optional[str]]:
+    """Worker: return the icon name, content hash and extracted SVG content for one file."""
+    return (icon_name,) + hash_and_extract(svg_path, known_hash)
 
 def safe_function_name(icon_name: str) -> str:
     """Convert icon name to a safe C++ function name."""
     # Convert kebab-case to snake_case
-    func_name = icon_name.replace('-', '_')
+    func_name = icon_name.translate(_HYPHEN_TRANS)
     
     # If it's a C++ keyword, append underscore
-    if func_name in CPP_KEYWORDS:
-        func_name += '_'
-    
-    return func_name
-
-def generate_icon_registry_code(icons: Dict[str, str]) -> str:
-    """Generate C++ code for icon registration."""
-    code = []
-    code.append("// Auto-generated icon registration code")
-    code.append("#include \"../lucideicon.hpp\"")
-    code.append("")
-    code.append("namespace LucideIcon {")
-    code.append("    namespace Generated {")
-    code.append("        void registerAllIcons() {")
-    code.append("            auto& registry = IconRegistry::getInstance();")
-    code.append("")
-    
-    for icon_name, svg_content in sorted(icons.items()):
-        # Escape quotes in SVG content
-        escaped_content = svg_content.replace('"', '\\"')
-        code.append(f'            registry.registerIcon("{icon_name}", R"({escaped_content})");')
-    
-    code.append("        }")
-    code.append("    }")
-    code.append("}")
-    
-    return "\n".join(code)
-
-def generate_icon_functions(icons: Dict[str, str]) -> str:
-    """Generate icon function implementations."""
-    code = []
-    code.append('// Auto-generated icon function implementations')
-    code.append('#include "../lucideicon.hpp"')
-    code.append("")
-    code.append("namespace LucideIcon {")
-    code.append("    namespace Icons {")
-    
-    for icon_name in sorted(icons.keys()):
-        # Convert kebab-case to safe function name
-        func_name = safe_function_name(icon_name)
-        code.append(f"        std::string {func_name}(const IconConfig& config) {{")
-        code.append(f'            return IconRegistry::getInstance().generateSVG("{icon_name}", config);')
-        code.append("        }")
-        code.append("")
-    
-    code.append("    }")
-    code.append("}")
-    
-    return "\n".join(code)
-
-def generate_header_declarations(icons: Dict[str, str]) -> str:
-    """Generate header declarations for icon functions."""
-    code = []
-    code.append("namespace LucideIcon {")
-    code.append("    namespace Icons {")
-    code.append("        // Auto-generated icon function declarations")
-    
-    for icon_name in sorted(icons.keys()):
-        func_name = safe_function_name(icon_name)
-        code.append(f"        std::string {func_name}(const IconConfig& config = IconConfig{{}});")
-    
-    code.append("    }")
-    code.append("}")
-    
-    return "\n".join(code)
+    return func_name + '_' if func_name in CPP_KEYWORDS else func_name
+
+def build_function_names(icon_names) -> Dict[str, str]:
+    """Map each icon name to its safe C++ function name."""
+    fn_map = {}
+    for icon_name in icon_names:
+        # Most names need no conversion, skip the translate for those
+        if '-' not in icon_name and icon_name not in CPP_KEYWORDS:
+            fn_map[icon_name] = icon_name
+        else:
+            fn_map[icon_name] = safe_function_name(icon_name)
+    return fn_map
+
+def generate_all(sorted_items: List[Tuple[str, str]], fn_map: Dict[str, str]) -> Tuple[bytes, bytes]:
+    """Generate the combined icon source file and the header declarations.
+    
+    Takes (name, svg) pairs sorted by name and fills the registry, function
+    and declaration sections in a single pass, looking up function names in
+    fn_map (see build_function_names). The registry and functions share one
+    translation unit behind a single #include.
+    Per-icon fragments are collected and joined every _BATCH_SIZE icons,
+    keeping buffer writes few while bounding the size of the pending lists.
+    """
+    reg_buf = io.StringIO()
+    fn_buf = io.StringIO()
+    hdr_buf = io.StringIO()
+    reg_write = reg_buf.write
+    fn_write = fn_buf.write
+    hdr_write = hdr_buf.write
+    
+    reg_write("// Auto-generated icon registration and function implementations\n")
+    reg_write("#include \"../lucideicon.hpp\"\n")
+    reg_write("\n")
+    reg_write("// Icon registration\n")
+    reg_write("namespace LucideIcon {\n")
+    reg_write("    namespace Generated {\n")
+    reg_write("        void registerAllIcons() {\n")
+    reg_write("            auto& registry = IconRegistry::getInstance();\n")
+    reg_write("\n")
+    
+    fn_write("\n")
+    fn_write("// Icon function implementations\n")
+    fn_write("namespace LucideIcon {\n")
+    fn_write("    namespace Icons {\n")
+    
+    hdr_write("namespace LucideIcon {\n")
+    hdr_write("    namespace Icons {\n")
+    hdr_write("        // Auto-generated icon function declarations\n")
+    
+    reg_parts = []
+    fn_parts = []
+    hdr_parts = []
+    
+    for index, (icon_name, svg_content) in enumerate(sorted_items, 1):
+        func_name = fn_map[icon_name]
+        
+        # Raw string literals take the content verbatim, so no escaping is
+        # needed; the custom delimiter keeps a stray )" from ending it early
+        reg_parts.extend((_REGISTRY_HEAD, icon_name, _REGISTRY_MID, svg_content, _REGISTRY_TAIL))
+        fn_parts.extend((_FUNC_HEAD, func_name, _FUNC_MID, icon_name, _FUNC_TAIL))
+        hdr_parts.extend((_DECL_HEAD, func_name, _DECL_TAIL))
+        
+        if index % _BATCH_SIZE == 0:
+            reg_write("".join(reg_parts))
+            fn_write("".join(fn_parts))
+            hdr_write("".join(hdr_parts))
+            reg_parts.clear()
+            fn_parts.clear()
+            hdr_parts.clear()
+    
+    # Flush the final partial batch
+    reg_write("".join(reg_parts))
+    fn_write("".join(fn_parts))
+    hdr_write("".join(hdr_parts))
+    
+    reg_write("        }\n")
+    reg_write("    }\n")
+    reg_write("}\n")
+    
+    fn_write("    }\n")
+    fn_write("}\n")
+    
+    hdr_write("    }\n")
+    hdr_write("}\n")
+    
+    return (
+        (reg_buf.getvalue() + fn_buf.getvalue()).encode('utf-8'),
+        hdr_buf.getvalue().encode('utf-8'),
+    )
+
+def generate_icon_list_json(icon_list: Dict[str, object]) -> bytes:
+    """Serialize the reference icon list, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(icon_list, option=orjson.OPT_INDENT_2)
+    return json.dumps(icon_list, separators=(',', ':')).encode('utf-8')
+
+def write_output(path: Path, data: bytes) -> bool:
+    """Write already-encoded file contents if they differ from what is on disk.
+    
+    Identical files are left alone so their mtime does not trigger rebuilds.
+    New contents go to a temporary file that is then renamed over the target,
+    so an aborted build never leaves a half-written output behind. Returns
+    True if the file was written.
+    """
+    try:
+        if path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'wb', buffering=0) as f:
+        view = memoryview(data)
+        # Unbuffered writes may be partial, so loop until everything is out
+        while view:
+            view = view[f.write(view):]
+    os.replace(tmp_path, path)
+    return True
+
+def load_build_cache(output_dir: Path, generator_hash: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """Load the icon hashes and extracted contents recorded by the previous run.
+    
+    Both are empty if either file is missing or unreadable, or if they were
+    written by a different version of this script.
+    """
+    try:
+        with open(output_dir / MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        with open(output_dir / CACHE_FILE, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}, {}
+    
+    if manifest.get("generator") != generator_hash:
+        return {}, {}
+    return manifest.get("icons", {}), cache
+
+def save_build_cache(output_dir: Path, generator_hash: str,
+                     hashes: Dict[str, str], contents: Dict[str, str]) -> None:
+    """Record icon hashes and extracted contents for the next run."""
+    with open(output_dir / CACHE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(contents, f)
+    with open(output_dir / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump({"generator": generator_hash, "icons": hashes}, f, indent=2, sort_keys=True)
 
 def main():
     """Main build function."""
@@ -169,54 +325,84 @@ def main():
     
     # Scan for SVG files
     icons = {}
-    svg_files = list(icons_dir.glob("*.svg"))
+    hashes = {}
+    contents = {}
+    # os.scandir yields DirEntry objects with cached file type, so no Path
+    # objects or per-entry stat calls are needed
+    with os.scandir(icons_dir) as it:
+        svg_files = [
+            entry for entry in it
+            if entry.name.endswith('.svg') and entry.is_file(follow_symlinks=False)
+        ]
+    # DirEntry objects cannot be pickled, so hand plain strings to the workers
+    icon_names = [entry.name[:-4] for entry in svg_files]
+    svg_paths = [entry.path for entry in svg_files]
     
     print(f"Found {len(svg_files)} SVG files")
     
-    for svg_file in svg_files:
-        icon_name = svg_file.stem
-        svg_content = extract_svg_content(svg_file)
-        
-        if svg_content:
-            icons[icon_name] = svg_content
-            print(f"  Processed: {icon_name}")
-        else:
-            print(f"  Warning: Could not extract content from {icon_name}")
+    # Hashes from the previous run; the script itself is part of the key so
+    # changes to the generator invalidate everything
+    generator_hash = blake2b(Path(__file__).read_bytes(), digest_size=8).hexdigest()
+    previous_hashes, cached_contents = load_build_cache(output_dir, generator_hash)
+    known_hashes = [previous_hashes.get(icon_name) for icon_name in icon_names]
+    
+    # Read and parse the SVG files across all cores; output is sorted at
+    # emission time, so completion order does not affect the result
+    with ProcessPoolExecutor() as executor:
+        results = executor.map(_process_one, icon_names, svg_paths, known_hashes, chunksize=64)
+        for icon_name, digest, svg_content in results:
+            hashes[icon_name] = digest
+            if svg_content is None:
+                # Unchanged since the last run, reuse the cached extraction
+                svg_content = cached_contents.get(icon_name, "")
+            contents[icon_name] = svg_content
+            
+            if svg_content:
+                icons[icon_name] = svg_content
+                print(f"  Processed: {icon_name}")
+            else:
+                print(f"  Warning: Could not extract content from {icon_name}")
     
     print(f"Successfully processed {len(icons)} icons")
     
+    # Nothing to do if no SVG changed and every output is still in place
+    if hashes == previous_hashes and all((output_dir / name).exists() for name in OUTPUT_FILES):
+        print(f"Icons unchanged, generated files are up to date in: {output_dir}")
+        return True
+    
     # Generate files
     print("Generating C++ files...")
     
-    # Generate icon registry
-    registry_code = generate_icon_registry_code(icons)
-    with open(output_dir / "icon_registry.cpp", 'w', encoding='utf-8') as f:
-        f.write(registry_code)
-    
-    # Generate icon functions
-    functions_code = generate_icon_functions(icons)
-    with open(output_dir / "icon_functions.cpp", 'w', encoding='utf-8') as f:
-        f.write(functions_code)
-    
-    # Generate header declarations
-    header_code = generate_header_declarations(icons)
-    with open(output_dir / "icon_declarations.hpp", 'w', encoding='utf-8') as f:
-        f.write(header_code)
+    # Sort once; the registry, functions and header are generated together
+    sorted_items = sorted(icons.items())
+    fn_map = build_function_names(icons)
+    source_code, header_code = generate_all(sorted_items, fn_map)
     
     # Generate icon list JSON for reference
     icon_list = {
         "total_icons": len(icons),
-        "icons": sorted(icons.keys())
+        "icons": [icon_name for icon_name, _ in sorted_items]
     }
+    icon_list_json = generate_icon_list_json(icon_list)
+    
+    outputs = [
+        ("icons_all.cpp", source_code),
+        ("icon_declarations.hpp", header_code),
+        ("icon_list.json", icon_list_json),
+    ]
+    
+    # The outputs are independent, so overlap their write latency
+    with ThreadPoolExecutor(max_workers=len(outputs)) as executor:
+        futures = [executor.submit(write_output, output_dir / name, data) for name, data in outputs]
+        for future in futures:
+            future.result()
     
-    with open(output_dir / "icon_list.json", 'w', encoding='utf-8') as f:
-        json.dump(icon_list, f, indent=2)
+    # Only record the new state once every output has been written
+    save_build_cache(output_dir, generator_hash, hashes, contents)
     
     print(f"Generated files in: {output_dir}")
-    print("  - icon_registry.cpp")
-    print("  - icon_functions.cpp")
-    print("  - icon_declarations.hpp")
-    print("  - icon_list.json")
+    for name in OUTPUT_FILES:
+        print(f"  - {name}")
     
     return True
 